@@ -3,11 +3,15 @@
 
 import json
 import os
-import subprocess
+import select
+import signal
 import sys
+import threading
 import time
-import urllib.request
+from collections import namedtuple
+from collections.abc import Callable, Mapping
 from pathlib import Path
+from types import MappingProxyType
 
 
 # Cache settings
@@ -37,6 +41,144 @@ CACHE_MAX_AGE = 3600  # 1 hour
 USAGE_CACHE_FILE = CACHE_DIR / "usage-cache"
 USAGE_CACHE_MAX_AGE = 300  # 5 minutes
 
+USAGE_API_URL = "https://api.anthropic.com/api/oauth/usage"
+
+# Minimum gap between background refreshes of the same cache, so renders
+# during an in-flight or failing refresh don't each fork another one
+REFRESH_RETRY_INTERVAL = 30  # seconds
+
+THEME_CACHE_FILE = CACHE_DIR / "dark-mode"
+THEME_CACHE_MAX_AGE = 60  # 1 minute
+
+GIT_CACHE_FILE = CACHE_DIR / "git-status"
+GIT_CACHE_MAX_AGE = 5  # seconds - working tree edits don't touch .git/index
+RENDER_CACHE_FILE = CACHE_DIR / "last-render"
+RENDER_CACHE_MAX_AGE = 5  # seconds - bounds staleness of reset times and refreshes
+
+# macOS system tools live at fixed paths; spawning them by absolute path skips
+# the PATH walk. git and npm are often user-installed, so those stay bare.
+DEFAULTS_BIN = "/usr/bin/defaults"
+SECURITY_BIN = "/usr/bin/security"
+
+
+def _fast_spawn(argv: list[str], timeout: float) -> tuple[int, str]:
+    """Run a short-lived helper and return (returncode, stdout).
+
+    Uses os.posix_spawnp directly, skipping subprocess.Popen's Python-side setup.
+    Raises FileNotFoundError if the program is missing, TimeoutError on timeout.
+    """
+    if not hasattr(os, "posix_spawnp"):
+        import subprocess
+
+        try:
+            result = subprocess.run(
+                argv, capture_output=True, text=True, timeout=timeout
+            )
+        except subprocess.TimeoutExpired as e:
+            raise TimeoutError(f"{argv[0]} timed out") from e
+        return result.returncode, result.stdout
+
+    # Pipe fds are non-inheritable; only the dup2'd stdout survives exec
+    read_fd, write_fd = os.pipe()
+    try:
+        pid = os.posix_spawnp(
+            argv[0],
+            argv,
+            os.environ,
+            file_actions=[
+                (os.POSIX_SPAWN_DUP2, write_fd, 1),
+                (os.POSIX_SPAWN_OPEN, 2, os.devnull, os.O_WRONLY, 0),
+            ],
+        )
+    except BaseException:
+        os.close(read_fd)
+        raise
+    finally:
+        os.close(write_fd)
+
+    # poll() rather than SIGALRM: this also runs off the main thread
+    poller = select.poll()
+    poller.register(read_fd, select.POLLIN)
+    chunks = []
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not poller.poll(remaining * 1000):
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+                raise TimeoutError(f"{argv[0]} timed out after {timeout}s")
+            chunk = os.read(read_fd, 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        os.close(read_fd)
+    _, status = os.waitpid(pid, 0)
+    return os.waitstatus_to_exitcode(status), b"".join(chunks).decode()
+
+
+def _run_in_background(task: Callable[[], None]) -> None:
+    """Run `task` in a detached grandchild so the status line never waits on it.
+
+    The intermediate child starts a new session, points stdin/stdout/stderr at
+    /dev/null (so whoever reads the status line sees EOF without waiting for the
+    worker), forks the worker and exits right away, so waitpid() returns
+    immediately and no zombie is left behind.
+    """
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.setsid()
+            devnull = os.open(os.devnull, os.O_RDWR)
+            for fd in (0, 1, 2):
+                os.dup2(devnull, fd)
+            if devnull > 2:
+                os.close(devnull)
+            if os.fork() == 0:
+                task()
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+
+
+def _read_cache(path: Path) -> tuple[bytes | None, float]:
+    """Read a cache file and its age in seconds with one open + fstat + read.
+
+    Returns (None, inf) if the file is missing or unreadable.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return None, float("inf")
+    try:
+        age = time.time() - os.fstat(fd).st_mtime
+        return os.read(fd, 65536), age
+    except OSError:
+        return None, float("inf")
+    finally:
+        os.close(fd)
+
+
+def _claim_refresh(cache_file: Path) -> bool:
+    """Return True at most once per REFRESH_RETRY_INTERVAL for `cache_file`."""
+    marker = cache_file.with_name(cache_file.name + ".refresh")
+    try:
+        if time.time() - marker.stat().st_mtime < REFRESH_RETRY_INTERVAL:
+            return False
+    except OSError:
+        pass
+    try:
+        marker.touch()
+    except OSError:
+        pass
+    return True
+
+
+def _run_defaults_read() -> tuple[int, str]:
+    """Read macOS's global AppleInterfaceStyle ("Dark", or unset in light mode)."""
+    return _fast_spawn([DEFAULTS_BIN, "read", "-g", "AppleInterfaceStyle"], 1)
+
 
 def detect_dark_mode() -> bool:
     """Detect if we should use dark mode colors. Returns True for dark, False for light."""
@@ -58,154 +200,223 @@ def detect_dark_mode() -> bool:
         except ValueError:
             pass
 
-    # 3. Check macOS system appearance
+    # 3. Check macOS system appearance (cached - it rarely changes)
+    content, cache_age = _read_cache(THEME_CACHE_FILE)
+    if content in (b"1", b"0") and cache_age < THEME_CACHE_MAX_AGE:
+        return content == b"1"
     try:
-        result = subprocess.run(
-            ["defaults", "read", "-g", "AppleInterfaceStyle"],
-            capture_output=True,
-            text=True,
-            timeout=1,
-        )
-        return result.stdout.strip().lower() == "dark"
-    except (subprocess.TimeoutExpired, FileNotFoundError, subprocess.SubprocessError):
+        _, stdout = _run_defaults_read()
+        dark = stdout.strip().lower() == "dark"
+    except (OSError, UnicodeDecodeError):
+        # Default to dark mode (most common for terminals)
+        dark = True
+    try:
+        THEME_CACHE_FILE.write_text("1" if dark else "0")
+    except OSError:
         pass
-
-    # Default to dark mode (most common for terminals)
-    return True
-
-
-def get_colors(dark_mode: bool) -> dict:
-    """Get color codes based on theme."""
-    reset = "\033[0m"
-    bold = "\033[1m"
-    dim = "\033[2m"
-
-    if dark_mode:
-        return {
-            "reset": reset,
-            "bold": bold,
-            "dim": dim,
-            "ctx_good": "\033[92m",  # bright green
-            "ctx_warn": "\033[93m",  # bright yellow
-            "ctx_crit": "\033[91m",  # bright red
-            "model": "\033[96m",  # bright cyan
-            "git": "\033[90m",  # gray
-            "update": "\033[93m",  # bright yellow
-            "usage_good": "\033[92m",  # bright green
-            "usage_warn": "\033[93m",  # bright yellow
-            "usage_crit": "\033[91m",  # bright red
-        }
-    else:
-        return {
-            "reset": reset,
-            "bold": bold,
-            "dim": dim,
-            "ctx_good": "\033[32m",  # dark green
-            "ctx_warn": "\033[33m",  # dark yellow/orange
-            "ctx_crit": "\033[31m",  # dark red
-            "model": "\033[34m",  # blue
-            "git": "\033[90m",  # dark gray
-            "update": "\033[33m",  # dark yellow
-            "usage_good": "\033[32m",  # dark green
-            "usage_warn": "\033[33m",  # dark yellow
-            "usage_crit": "\033[31m",  # dark red
-        }
+    return dark
+
+
+_RESET = "\033[0m"
+_BOLD = "\033[1m"
+_DIM = "\033[2m"
+
+_DARK_COLORS = MappingProxyType(
+    {
+        "reset": _RESET,
+        "bold": _BOLD,
+        "dim": _DIM,
+        "ctx_good": "\033[92m",  # bright green
+        "ctx_warn": "\033[93m",  # bright yellow
+        "ctx_crit": "\033[91m",  # bright red
+        "model": "\033[96m",  # bright cyan
+        "git": "\033[90m",  # gray
+        "update": "\033[93m",  # bright yellow
+        "usage_good": "\033[92m",  # bright green
+        "usage_warn": "\033[93m",  # bright yellow
+        "usage_crit": "\033[91m",  # bright red
+    }
+)
+
+_LIGHT_COLORS = MappingProxyType(
+    {
+        "reset": _RESET,
+        "bold": _BOLD,
+        "dim": _DIM,
+        "ctx_good": "\033[32m",  # dark green
+        "ctx_warn": "\033[33m",  # dark yellow/orange
+        "ctx_crit": "\033[31m",  # dark red
+        "model": "\033[34m",  # blue
+        "git": "\033[90m",  # dark gray
+        "update": "\033[33m",  # dark yellow
+        "usage_good": "\033[32m",  # dark green
+        "usage_warn": "\033[33m",  # dark yellow
+        "usage_crit": "\033[31m",  # dark red
+    }
+)
+
+
+# Percentage (clamped to 0-100) -> palette key / fill icon, so main() does a
+# single index instead of walking a threshold ladder.
+_CTX_COLOR_KEY = tuple(
+    "ctx_good" if p < 50 else "ctx_warn" if p < 75 else "ctx_crit" for p in range(101)
+)
+_CTX_ICON = tuple(
+    "◔" if p < 25 else "◑" if p < 50 else "◕" if p < 75 else "●" for p in range(101)
+)
+_USAGE_COLOR_KEY = tuple(
+    "usage_good" if p < 50 else "usage_warn" if p < 80 else "usage_crit"
+    for p in range(101)
+)
+
+
+def get_colors(dark_mode: bool) -> Mapping[str, str]:
+    """Get color codes based on theme. Returns a shared read-only mapping."""
+    return _DARK_COLORS if dark_mode else _LIGHT_COLORS
 
 
 def get_claude_oauth_token() -> str | None:
     """Get Claude Code OAuth token from macOS Keychain."""
     try:
-        result = subprocess.run(
+        returncode, stdout = _fast_spawn(
             [
-                "security",
+                SECURITY_BIN,
                 "find-generic-password",
                 "-s",
                 "Claude Code-credentials",
                 "-w",
             ],
-            capture_output=True,
-            text=True,
-            timeout=2,
+            2,
         )
-        if result.returncode != 0:
+        if returncode != 0:
             return None
 
-        creds = json.loads(result.stdout.strip())
+        creds = json.loads(stdout.strip())
         return creds.get("claudeAiOauth", {}).get("accessToken")
-    except (
-        subprocess.TimeoutExpired,
-        subprocess.SubprocessError,
-        json.JSONDecodeError,
-        KeyError,
-        FileNotFoundError,
-    ):
+    except (json.JSONDecodeError, KeyError, OSError, UnicodeDecodeError):
         pass
     return None
 
 
+def _parse_http_response(response: bytes) -> bytes:
+    """Return the body of a raw HTTP/1.1 response, raising OSError unless 200."""
+    head, _, body = response.partition(b"\r\n\r\n")
+    status_line, *header_lines = head.decode("latin-1").split("\r\n")
+    status = status_line.split(" ", 2)[1] if status_line.count(" ") else ""
+    if status != "200":
+        raise OSError(f"HTTP status {status or '?'}")
+
+    headers = {}
+    for line in header_lines:
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip().lower()
+    if headers.get("transfer-encoding") != "chunked":
+        return body
+
+    chunks = []
+    while True:
+        size_line, _, body = body.partition(b"\r\n")
+        size = int(size_line.split(b";")[0], 16)
+        if size == 0:
+            return b"".join(chunks)
+        chunks.append(body[:size])
+        body = body[size + 2 :]  # Skip chunk data and its trailing CRLF
+
+
+def _https_get(url: str, headers: dict[str, str], timeout: float) -> bytes:
+    """Minimal HTTPS GET over a raw TLS socket, returning the response body.
+
+    Avoids importing urllib.request (and with it http.client and email) in the
+    background child, which otherwise dominates its runtime.
+    """
+    import socket
+    import ssl
+
+    host, _, path = url.removeprefix("https://").partition("/")
+    request = f"GET /{path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n"
+    request += "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+    request += "\r\n"
+
+    context = ssl.create_default_context()
+    with (
+        socket.create_connection((host, 443), timeout=timeout) as sock,
+        context.wrap_socket(sock, server_hostname=host) as tls,
+    ):
+        tls.sendall(request.encode())
+        chunks = []
+        while chunk := tls.recv(65536):
+            chunks.append(chunk)
+    return _parse_http_response(b"".join(chunks))
+
+
 def get_claude_usage() -> dict | None:
     """Get Claude.ai usage stats (5h and weekly). Uses cache to avoid frequent API calls.
 
     Returns dict with 'five_hour' and 'seven_day' percentages, or None.
     """
     # Check cache
-    if USAGE_CACHE_FILE.exists():
-        cache_age = time.time() - USAGE_CACHE_FILE.stat().st_mtime
-        if cache_age < USAGE_CACHE_MAX_AGE:
-            try:
-                return json.loads(USAGE_CACHE_FILE.read_text())
-            except (json.JSONDecodeError, IOError):
-                pass
-
-    # Get OAuth token
-    token = get_claude_oauth_token()
-    if not token:
-        return None
+    content, cache_age = _read_cache(USAGE_CACHE_FILE)
+    if content is not None and cache_age < USAGE_CACHE_MAX_AGE:
+        try:
+            return json.loads(content)
+        except ValueError:
+            pass
 
-    # Fetch usage in background to not block status line
-    try:
-        pid = os.fork()
-        if pid == 0:
-            # Child process - fetch and cache
-            try:
-                # Use OAuth endpoint - no org ID needed
-                req = urllib.request.Request(
-                    "https://api.anthropic.com/api/oauth/usage",
-                    headers={
-                        "Authorization": f"Bearer {token}",
-                        "Content-Type": "application/json",
-                        "User-Agent": "claude-code/2.1.5",
-                        "anthropic-beta": "oauth-2025-04-20",
-                    },
-                )
+    def fetch_usage():
+        try:
+            # Use OAuth endpoint - no org ID needed
+            headers = {
+                "Authorization": f"Bearer {token}",
+                "Content-Type": "application/json",
+                "User-Agent": "claude-code/2.1.5",
+                "anthropic-beta": "oauth-2025-04-20",
+            }
+            if os.environ.get("CLAUDE_STATUSLINE_URLLIB") == "1":
+                import urllib.request
+
+                req = urllib.request.Request(USAGE_API_URL, headers=headers)
                 with urllib.request.urlopen(req, timeout=10) as resp:
-                    data = json.loads(resp.read().decode())
-                    usage = {
-                        "five_hour": data.get("five_hour", {}).get("utilization", 0),
-                        "five_hour_resets": data.get("five_hour", {}).get(
-                            "resets_at", ""
-                        ),
-                        "seven_day": data.get("seven_day", {}).get("utilization", 0),
-                        "seven_day_resets": data.get("seven_day", {}).get(
-                            "resets_at", ""
-                        ),
-                    }
-                    USAGE_CACHE_FILE.write_text(json.dumps(usage))
-            except Exception:
-                pass
-            os._exit(0)
-    except (OSError, AttributeError):
-        pass
+                    data = json.loads(resp.read())
+            else:
+                data = json.loads(_https_get(USAGE_API_URL, headers, timeout=10))
+            usage = {
+                "five_hour": data.get("five_hour", {}).get("utilization", 0),
+                "five_hour_resets": data.get("five_hour", {}).get("resets_at", ""),
+                "seven_day": data.get("seven_day", {}).get("utilization", 0),
+                "seven_day_resets": data.get("seven_day", {}).get("resets_at", ""),
+            }
+            USAGE_CACHE_FILE.write_text(json.dumps(usage))
+        except Exception:
+            pass
+
+    # A refresh is already running or failed recently - serve the stale cache
+    if _claim_refresh(USAGE_CACHE_FILE):
+        # Get OAuth token
+        token = get_claude_oauth_token()
+        if not token:
+            # Logged out - stale usage would be misleading
+            USAGE_CACHE_FILE.unlink(missing_ok=True)
+            return None
+
+        # Fetch usage in background to not block status line
+        try:
+            _run_in_background(fetch_usage)
+        except (OSError, AttributeError):
+            pass
 
     # Return cached value if exists
-    if USAGE_CACHE_FILE.exists():
+    if content is not None:
         try:
-            return json.loads(USAGE_CACHE_FILE.read_text())
-        except (json.JSONDecodeError, IOError):
+            return json.loads(content)
+        except ValueError:
             pass
     return None
 
 
+# 12-hour clock labels indexed by 0-23 hour
+_HOUR_LABELS = tuple(f"{(h - 1) % 12 + 1}{'am' if h < 12 else 'pm'}" for h in range(24))
+
+
 def format_reset_time(iso_timestamp: str) -> str:
     """Format ISO timestamp to local time like '2am' or '3pm'."""
     if not iso_timestamp:
@@ -213,119 +424,268 @@ def format_reset_time(iso_timestamp: str) -> str:
     try:
         from datetime import datetime, timedelta
 
-        # Parse ISO format and convert to local time
-        dt = datetime.fromisoformat(iso_timestamp.replace("Z", "+00:00"))
+        # Parse ISO format (3.11+ accepts a trailing "Z") and convert to local time
+        dt = datetime.fromisoformat(iso_timestamp)
         local_dt = dt.astimezone()
         # Round up to next hour if there are any minutes/seconds
         if local_dt.minute > 0 or local_dt.second > 0:
             local_dt = local_dt + timedelta(hours=1)
-        hour = local_dt.hour
-        if hour == 0:
-            return "12am"
-        elif hour < 12:
-            return f"{hour}am"
-        elif hour == 12:
-            return "12pm"
-        else:
-            return f"{hour - 12}pm"
-    except (ValueError, TypeError, AttributeError):
+        return _HOUR_LABELS[local_dt.hour]
+    except (ValueError, TypeError):
         return ""
 
 
-def get_git_status(directory: str) -> tuple[str | None, bool]:
-    """Get current git branch and dirty status in a single call."""
-    if not directory or not Path(directory).is_dir():
-        return None, False
+def _find_git_dir(directory: str) -> Path | None:
+    """Find the git directory for `directory`, following `.git` files (worktrees)."""
+    path = Path(directory).absolute()
+    for candidate in (path, *path.parents):
+        dot_git = candidate / ".git"
+        if dot_git.is_dir():
+            return dot_git
+        if dot_git.is_file():
+            try:
+                content = dot_git.read_text().strip()
+            except OSError:
+                return None
+            if content.startswith("gitdir: "):
+                return candidate / content[len("gitdir: ") :]
+            return None
+    return None
+
+
+def _git_cache_key(git_dir: Path) -> list[int] | None:
+    """Cache key from HEAD and index mtimes; None if HEAD is missing."""
     try:
-        result = subprocess.run(
-            ["git", "status", "--porcelain", "-b"],
-            capture_output=True,
-            text=True,
-            timeout=1,
-            cwd=directory,
+        head_mtime = (git_dir / "HEAD").stat().st_mtime_ns
+    except OSError:
+        return None
+    try:
+        index_mtime = (git_dir / "index").stat().st_mtime_ns
+    except OSError:
+        index_mtime = 0  # No index yet (fresh repo)
+    return [head_mtime, index_mtime]
+
+
+def _load_git_cache() -> dict:
+    content, _ = _read_cache(GIT_CACHE_FILE)
+    try:
+        cache = json.loads(content) if content else {}
+    except ValueError:
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+def _read_head_branch(git_dir: Path) -> str | None:
+    """Read the current branch straight from HEAD (no subprocess). None if detached."""
+    try:
+        # Ref names are UTF-8 regardless of the locale
+        head = (git_dir / "HEAD").read_bytes().decode().strip()
+    except (OSError, UnicodeDecodeError):
+        return None
+    if head.startswith("ref: refs/heads/"):
+        branch = head[len("ref: refs/heads/") :]
+        # reftable repositories keep a placeholder HEAD
+        if branch != ".invalid":
+            return branch
+    return None
+
+
+def _render_cache_key(fields: list, directory: str) -> str:
+    """Key for the rendered line: the input fields it shows, theme env, and mtimes.
+
+    Only displayed fields are used: the rest of the payload (durations, cost,
+    line counts) changes on every call and would defeat the cache.
+    """
+    paths = [CACHE_FILE, USAGE_CACHE_FILE, THEME_CACHE_FILE]
+    git_dir = _find_git_dir(directory) if directory else None
+    if git_dir is not None:
+        paths += [git_dir / "HEAD", git_dir / "index"]
+    mtimes = []
+    for path in paths:
+        try:
+            mtimes.append(path.stat().st_mtime_ns)
+        except OSError:
+            mtimes.append(0)
+    env = [
+        os.environ.get(name)
+        for name in (
+            "CLAUDE_STATUSLINE_THEME",
+            "COLORFGBG",
+            "CLAUDE_STATUSLINE_GIT_DIRTY",
         )
-        if result.returncode != 0 or not result.stdout.strip():
-            return None, False
+    ]
+    # json.dumps escapes newlines, so the key always fits on one line
+    return json.dumps([fields, env, mtimes])
 
-        lines = result.stdout.splitlines()
-        header = lines[0]  # e.g. "## main...origin/main"
-        dirty = len(lines) > 1
 
-        if not header.startswith("## "):
-            return None, dirty
+def _load_render_cache(key: str) -> str | None:
+    """The previously rendered line if `key` matches and it is still fresh."""
+    content, age = _read_cache(RENDER_CACHE_FILE)
+    if content is None or age >= RENDER_CACHE_MAX_AGE:
+        return None
+    try:
+        cached_key, _, line = content.decode().partition("\n")
+    except UnicodeDecodeError:
+        return None
+    return line if cached_key == key else None
 
-        branch_info = header[3:]
 
-        # Detached HEAD: "## HEAD (no branch)"
-        if branch_info.startswith("HEAD (no branch)"):
-            return None, dirty
+# Everything the status line reads from git, gathered by one `git status` call.
+# upstream/ahead/behind stay at their defaults when there is no upstream.
+GitInfo = namedtuple(
+    "GitInfo",
+    ["branch", "dirty", "upstream", "ahead", "behind"],
+    defaults=[None, False, None, 0, 0],
+)
 
-        # New repo: "## No commits yet on main"
-        if " on " in branch_info and (
-            "No commits yet" in branch_info or "Initial commit" in branch_info
-        ):
-            return branch_info.split(" on ", 1)[1], dirty
 
-        # Normal: "main" or "main...origin/main"
-        branch = branch_info.split("...")[0]
-        return branch if branch else None, dirty
+def get_git_status(directory: str) -> GitInfo:
+    """Get current git branch, dirty status and upstream tracking in a single call.
 
-    except (subprocess.TimeoutExpired, FileNotFoundError, subprocess.SubprocessError):
-        return None, False
+    Untracked files and submodules are not considered: skipping those walks is
+    what keeps `git status` cheap on large repositories. Results are cached
+    per directory until HEAD or the index changes (or GIT_CACHE_MAX_AGE passes).
+
+    The branch is read from HEAD directly, so it is shown even if git is missing
+    or times out. With CLAUDE_STATUSLINE_GIT_DIRTY=0 no subprocess is spawned at
+    all and dirty is always False.
+    """
+    if not directory or not Path(directory).is_dir():
+        return GitInfo()
+    git_dir = _find_git_dir(directory)
+    if git_dir is None:
+        return GitInfo()
+    if os.environ.get("CLAUDE_STATUSLINE_GIT_DIRTY", "1") == "0":
+        return GitInfo(_read_head_branch(git_dir))
+
+    # Entries are [head_mtime_ns, index_mtime_ns, checked_at, *GitInfo]
+    entry_len = 3 + len(GitInfo._fields)
+    key = _git_cache_key(git_dir)
+    cache = _load_git_cache()
+    entry = cache.get(directory)
+    now = time.time()
+    if (
+        key is not None
+        and isinstance(entry, list)
+        and len(entry) == entry_len
+        and entry[:2] == key
+        and now - entry[2] < GIT_CACHE_MAX_AGE
+    ):
+        return GitInfo(*entry[3:])
+
+    branch = _read_head_branch(git_dir)
+    dirty = False
+    upstream = None
+    ahead = behind = 0
+    try:
+        returncode, stdout = _fast_spawn(
+            [
+                "git",
+                "-C",
+                directory,
+                "--no-optional-locks",
+                "status",
+                "--porcelain=v2",
+                "--branch",
+                "--ignore-submodules=all",
+                "--untracked-files=no",
+            ],
+            1,
+        )
+        if returncode != 0:
+            return GitInfo(branch)
+
+        for line in stdout.splitlines():
+            if line.startswith("# branch.head "):
+                head = line[len("# branch.head ") :]
+                # Detached HEAD: "# branch.head (detached)"
+                if branch is None and head != "(detached)":
+                    branch = head
+            elif line.startswith("# branch.upstream "):
+                upstream = line[len("# branch.upstream ") :]
+            elif line.startswith("# branch.ab "):
+                # "# branch.ab +<ahead> -<behind>"
+                ab = line[len("# branch.ab ") :].split()
+                ahead, behind = int(ab[0]), -int(ab[1])
+            elif not line.startswith("#"):
+                dirty = True
+
+    except (OSError, UnicodeDecodeError, ValueError, IndexError):
+        return GitInfo(branch)
+
+    info = GitInfo(branch, dirty, upstream, ahead, behind)
+
+    # Update cache, dropping expired entries so the file stays small
+    if key is not None:
+        cache = {
+            d: e
+            for d, e in cache.items()
+            if isinstance(e, list)
+            and len(e) == entry_len
+            and now - e[2] < GIT_CACHE_MAX_AGE
+        }
+        cache[directory] = [*key, now, *info]
+        try:
+            GIT_CACHE_FILE.write_text(json.dumps(cache))
+        except OSError:
+            pass
+    return info
+
+
+def _cached_update(content: bytes | None, current_version: str) -> str | None:
+    """Parse update cache content ("update:<version>", "current" or "error")."""
+    if content is None:
+        return None
+    text = content.decode(errors="replace").strip()
+    if text.startswith("update:"):
+        cached_version = text[7:]
+        if cached_version != current_version:
+            return cached_version
+    return None
 
 
 def check_for_update(current_version: str) -> str | None:
     """Check if update is available. Uses cache to avoid frequent npm calls."""
     # Check cache age
-    if CACHE_FILE.exists():
-        cache_age = time.time() - CACHE_FILE.stat().st_mtime
-        if cache_age < CACHE_MAX_AGE:
-            content = CACHE_FILE.read_text().strip()
-            if content.startswith("update:"):
-                cached_version = content[7:]
-                if cached_version != current_version:
-                    return cached_version
-            return None
+    content, cache_age = _read_cache(CACHE_FILE)
+    if content is not None and cache_age < CACHE_MAX_AGE:
+        return _cached_update(content, current_version)
 
-    # Cache expired or doesn't exist - check in background
-    try:
-        # Fork to background for the check
-        pid = os.fork()
-        if pid == 0:
-            # Child process - do the check
-            try:
-                result = subprocess.run(
-                    ["npm", "view", "@anthropic-ai/claude-code", "version"],
-                    capture_output=True,
-                    text=True,
-                    timeout=10,
-                )
-                latest = result.stdout.strip()
-                if latest and latest != current_version:
-                    CACHE_FILE.write_text(f"update:{latest}")
-                else:
-                    CACHE_FILE.write_text("current")
-            except Exception:
-                CACHE_FILE.write_text("error")
-            os._exit(0)
-    except (OSError, AttributeError):
-        # os.fork not available (Windows) or failed - skip update check
-        pass
+    def fetch_latest_version():
+        import subprocess
+
+        try:
+            result = subprocess.run(
+                ["npm", "view", "@anthropic-ai/claude-code", "version"],
+                capture_output=True,
+                text=True,
+                timeout=10,
+            )
+            latest = result.stdout.strip()
+            if latest and latest != current_version:
+                CACHE_FILE.write_text(f"update:{latest}")
+            else:
+                CACHE_FILE.write_text("current")
+        except Exception:
+            CACHE_FILE.write_text("error")
+
+    # Cache expired or doesn't exist - check in background, unless another
+    # render already started a check recently
+    if _claim_refresh(CACHE_FILE):
+        try:
+            _run_in_background(fetch_latest_version)
+        except (OSError, AttributeError):
+            # os.fork not available (Windows) or failed - skip update check
+            pass
 
     # Return cached value if exists
-    if CACHE_FILE.exists():
-        content = CACHE_FILE.read_text().strip()
-        if content.startswith("update:"):
-            cached_version = content[7:]
-            if cached_version != current_version:
-                return cached_version
-    return None
+    return _cached_update(content, current_version)
 
 
 def main():
     # Read JSON from stdin
     try:
-        data = json.load(sys.stdin)
+        data = json.loads(sys.stdin.read())
     except json.JSONDecodeError:
         print("◐ --% ✦")
         return
@@ -350,59 +710,58 @@ def main():
     )
     version = data.get("version", "") or ""
 
+    # Same displayed fields with unchanged caches and git state render the same line
+    render_key = _render_cache_key(
+        [model, context_pct, current_dir, version], current_dir
+    )
+    line = _load_render_cache(render_key)
+    if line is not None:
+        print(line)
+        return
+
+    # Look up git status in a thread while theme detection runs, since both
+    # may wait on a subprocess. Joined before the usage and update checks,
+    # which fork and must not run alongside other threads.
+    git_status = []
+    git_thread = threading.Thread(
+        target=lambda: git_status.append(get_git_status(current_dir))
+    )
+    git_thread.start()
+
     # Detect theme and get colors
     dark_mode = detect_dark_mode()
     c = get_colors(dark_mode)
-
-    # Context color based on percentage
-    if context_pct < 50:
-        ctx_color = c["ctx_good"]
-    elif context_pct < 75:
-        ctx_color = c["ctx_warn"]
-    else:
-        ctx_color = c["ctx_crit"]
+    git_thread.join()
 
     # Build status parts
     parts = []
 
-    # Context percentage with fill-level icon
-    if context_pct < 25:
-        ctx_icon = "◔"
-    elif context_pct < 50:
-        ctx_icon = "◑"
-    elif context_pct < 75:
-        ctx_icon = "◕"
-    else:
-        ctx_icon = "●"
+    # Context percentage with fill-level icon, colored by level
+    ctx_level = min(max(context_pct, 0), 100)
+    ctx_color = c[_CTX_COLOR_KEY[ctx_level]]
+    ctx_icon = _CTX_ICON[ctx_level]
     parts.append(f"{ctx_color}{ctx_icon} {context_pct}%{c['reset']}")
 
     # Model
     parts.append(f"{c['model']}✦ {model}{c['reset']}")
 
     # Git branch
-    branch, dirty = get_git_status(current_dir)
-    if branch:
-        dirty_mark = f"{c['ctx_warn']}*{c['reset']}" if dirty else ""
-        parts.append(f"{c['git']}⎇ {branch}{dirty_mark}{c['reset']}")
+    git = git_status[0] if git_status else GitInfo()
+    if git.branch:
+        dirty_mark = f"{c['ctx_warn']}*{c['reset']}" if git.dirty else ""
+        parts.append(f"{c['git']}⎇ {git.branch}{dirty_mark}{c['reset']}")
 
     # Claude.ai usage (5h limit)
     usage = get_claude_usage()
     if usage:
         five_h = int(usage.get("five_hour", 0))
         five_h_reset = format_reset_time(usage.get("five_hour_resets", ""))
-
-        # Color based on usage level
-        def usage_color(pct: int) -> str:
-            if pct < 50:
-                return c["usage_good"]
-            elif pct < 80:
-                return c["usage_warn"]
-            return c["usage_crit"]
+        usage_color = c[_USAGE_COLOR_KEY[min(max(five_h, 0), 100)]]
 
         five_h_str = f"⏱ {five_h}%"
         if five_h_reset:
             five_h_str += f"→{five_h_reset}"
-        parts.append(f"{usage_color(five_h)}{five_h_str}{c['reset']}")
+        parts.append(f"{usage_color}{five_h_str}{c['reset']}")
 
     # Update indicator
     if version:
@@ -410,7 +769,12 @@ def main():
         if latest:
             parts.append(f"{c['update']}↑{latest}{c['reset']}")
 
-    print(" ".join(parts))
+    line = " ".join(parts)
+    print(line)
+    try:
+        RENDER_CACHE_FILE.write_text(f"{render_key}\n{line}")
+    except OSError:
+        pass
 
 
 if __name__ == "__main__":